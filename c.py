@@ -1,12 +1,17 @@
 from compy import *
 
+class _CNameTable(dict[int, str]):
+  def __missing__(self, code: int) -> str:
+    char = chr(code)
+    if char.isalpha() or char == "_": mapped = char
+    else: mapped = f"_{code}"
+    self[code] = mapped
+    return mapped
+
+_C_NAME_TABLE = _CNameTable()
+
 def to_c_name(name: str) -> str:
-  new = ""
-  for char in name:
-    if char.isalpha(): new += char
-    elif char == "_": new += char
-    else: new += f"_{ord(char)}"
-  return new
+  return name.translate(_C_NAME_TABLE)
 
 @dataclass
 class C_Identifier:
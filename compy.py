@@ -1,12 +1,17 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from itertools import count
 from enum import Enum, auto
 import re
+try:
+  import re._parser as sre_parse
+except ImportError: # Python < 3.11
+  import sre_parse # type: ignore
 from typing import Any, Callable, Generic, TypeAlias, TypeVar
 
 
 TokenTypes_T = TypeVar("TokenTypes_T", bound=Enum)
 
-@dataclass
+@dataclass(slots=True)
 class Location:
   file: str
   line: int
@@ -14,7 +19,7 @@ class Location:
   def __repr__(self):
     return f"{self.file}:{self.line}:{self.column}"
 
-@dataclass
+@dataclass(slots=True)
 class Token(Generic[TokenTypes_T]):
   type: TokenTypes_T
   value: str
@@ -36,116 +41,422 @@ class LexingError(Exception):
   def __str__(self):
     return f"{self.location}: {self.message}"
 
+_CATEGORY_PROBES: dict[Any, re.Pattern[str]] = {
+  sre_parse.CATEGORY_DIGIT: re.compile(r"\d"),
+  sre_parse.CATEGORY_NOT_DIGIT: re.compile(r"\D"),
+  sre_parse.CATEGORY_SPACE: re.compile(r"\s"),
+  sre_parse.CATEGORY_NOT_SPACE: re.compile(r"\S"),
+  sre_parse.CATEGORY_WORD: re.compile(r"\w"),
+  sre_parse.CATEGORY_NOT_WORD: re.compile(r"\W"),
+}
+
+# flags under which the probes above don't tell what a pattern can match
+_UNKNOWN_FLAGS = re.IGNORECASE | re.LOCALE | re.ASCII
+
+_REPEAT_OPS = (
+  sre_parse.MAX_REPEAT,
+  sre_parse.MIN_REPEAT,
+  getattr(sre_parse, "POSSESSIVE_REPEAT", None), # Python 3.11+
+)
+
+def _first_chars_of_seq(items: Any) -> tuple[set[int] | None, bool]:
+  firsts: set[int] = set()
+  for op, av in items:
+    chars, nullable = _first_chars_of_item(op, av)
+    if chars is None: return None, True
+    firsts |= chars
+    if not nullable: return firsts, False
+  return firsts, True
+
+def _first_chars_of_item(op: Any, av: Any) -> tuple[set[int] | None, bool]:
+  if op is sre_parse.LITERAL:
+    return {av}, False
+  if op is sre_parse.AT:
+    return set(), True
+  if op is sre_parse.IN:
+    chars: set[int] = set()
+    negate = False
+    for item_op, item_av in av:
+      if item_op is sre_parse.NEGATE:
+        negate = True
+      elif item_op is sre_parse.LITERAL:
+        chars.add(item_av)
+      elif item_op is sre_parse.RANGE:
+        chars.update(range(item_av[0], min(item_av[1], 255) + 1))
+      elif item_op is sre_parse.CATEGORY and item_av in _CATEGORY_PROBES:
+        probe = _CATEGORY_PROBES[item_av]
+        chars.update(c for c in range(256) if probe.match(chr(c)))
+      else:
+        return None, True
+    if negate:
+      chars = set(range(256)) - chars
+    return chars, False
+  if op is sre_parse.SUBPATTERN:
+    _, add_flags, _, items = av
+    if add_flags & _UNKNOWN_FLAGS: return None, True
+    return _first_chars_of_seq(items)
+  if op in _REPEAT_OPS:
+    low, _, items = av
+    chars, nullable = _first_chars_of_seq(items)
+    return chars, nullable or low == 0
+  if op is sre_parse.BRANCH:
+    firsts: set[int] = set()
+    any_nullable = False
+    for branch in av[1]:
+      chars, nullable = _first_chars_of_seq(branch)
+      if chars is None: return None, True
+      firsts |= chars
+      any_nullable = any_nullable or nullable
+    return firsts, any_nullable
+  return None, True
+
+# characters below 256 that a match of `regex` can start with,
+# or None when that can't be worked out from the pattern alone
+def _first_chars(regex: str) -> set[int] | None:
+  try:
+    parsed = sre_parse.parse(regex)
+  except re.error:
+    return None
+  if parsed.state.flags & _UNKNOWN_FLAGS: return None
+  chars, nullable = _first_chars_of_seq(parsed)
+  if nullable: return None
+  return chars
+
+_GROUPREF_OPS = (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS)
+
+# whether `regex` can be joined into one alternation with other patterns:
+# its named groups could clash with theirs, references to groups by number
+# would point at the wrong group once groups come before it, and
+# global flags would no longer be at the start of the pattern
+def _can_merge(regex: re.Pattern[str]) -> bool:
+  if regex.groupindex: return False
+  # global inline flags, like (?a) or (?x), are only allowed at the start
+  if regex.flags & ~re.UNICODE: return False
+  stack = [sre_parse.parse(regex.pattern)]
+  while stack:
+    for op, av in stack.pop():
+      if op in _GROUPREF_OPS: return False
+      if isinstance(av, sre_parse.SubPattern): # e.g. atomic groups
+        stack.append(av)
+        continue
+      for arg in av if isinstance(av, (tuple, list)) else ():
+        if isinstance(arg, sre_parse.SubPattern):
+          stack.append(arg)
+        elif isinstance(arg, list):
+          stack.extend(a for a in arg if isinstance(a, sre_parse.SubPattern))
+  return True
+
+# whether `regex` is a single unbounded repetition, such as \s+,
+# so that repeating it again wouldn't match anything more
+def _is_repeated(regex: str) -> bool:
+  try:
+    parsed = sre_parse.parse(regex)
+  except re.error:
+    return False
+  if len(parsed) != 1: return False
+  op, av = parsed[0]
+  # lazy repetitions stop after their minimum, so they don't count
+  if op not in _REPEAT_OPS or op is sre_parse.MIN_REPEAT: return False
+  return av[0] >= 1 and av[1] == sre_parse.MAXREPEAT
+
+# whether `regex` might match the empty string, or it can't be told, which
+# would stop a repeated alternation of skips before the skips after it
+def _is_nullable(regex: str) -> bool:
+  try:
+    parsed = sre_parse.parse(regex)
+  except re.error:
+    return True
+  _, nullable = _first_chars_of_seq(parsed)
+  return nullable
+
 LexingResult: TypeAlias = list[Token[TokenTypes_T]] | LexingError
 
+ScanningResult: TypeAlias = tuple[list[TokenTypes_T], list[int], list[int]] | LexingError
+
 class Lexer(Generic[TokenTypes_T]):
   def __init__(self):
-    self.regexes: dict[TokenTypes_T, str] = {}
+    self.regexes: dict[TokenTypes_T, re.Pattern[str]] = {}
     self.strings: dict[TokenTypes_T, str] = {}
-    self.regex_skips: list[str] = []
+    self.regex_skips: list[re.Pattern[str]] = []
     self.string_skips: list[str] = []
+    self._skip_re: re.Pattern[str] | None = None
+    self._skip_impl: Callable[[str, int], int] = self._skip_none
+    self._mergeable: dict[TokenTypes_T, bool] = {}
+    # (pattern, type) pairs tried in order, where a None type means the
+    # pattern is an alternation and the match's lastgroup gives the type
+    self._compiled: tuple[tuple[re.Pattern[str], TokenTypes_T | None], ...] | None = None
+    self._group_to_type: dict[str, TokenTypes_T] = {}
+    self._start_table: list[tuple[tuple[re.Pattern[str], TokenTypes_T | None], ...]] = []
+    self._str_trie: dict[str | None, Any] = {}
+    self._single_char_strings: dict[str, TokenTypes_T] = {}
 
   def add_regex(self, type: TokenTypes_T, regex: str) -> None:
-    regex = "^(" + regex + ")"
-    self.regexes[type] = regex
+    compiled = re.compile(regex)
+    self.regexes[type] = compiled
+    self._mergeable[type] = _can_merge(compiled)
+    self._compiled = None
 
   def add_str(self, type: TokenTypes_T, string: str) -> None:
     self.strings[type] = string
+    self._compiled = None
 
   def skip_regex(self, regex: str) -> None:
-    regex = "^(" + regex + ")"
-    self.regex_skips.append(regex)
+    self.regex_skips.append(re.compile(regex))
+    self._compile_skips()
 
   def skip_string(self, string: str) -> None:
     self.string_skips.append(string)
+    self._compile_skips()
+
+  def _compile_skips(self) -> None:
+    # pick the cheapest way of skipping for the skips registered so far
+    if len(self.regex_skips) == 0 and len(self.string_skips) == 1:
+      self._skip_impl = self._skip_single_string
+      return
+
+    if len(self.regex_skips) == 1 and len(self.string_skips) == 0 \
+       and _is_repeated(self.regex_skips[0].pattern):
+      # already consumes a whole run by itself, like \s+
+      self._skip_re = self.regex_skips[0]
+    elif not all(_can_merge(skip) and not _is_nullable(skip.pattern) for skip in self.regex_skips):
+      # each skip is tried on its own until none of them moves forward
+      self._skip_impl = self._skip_separately
+      return
+    else:
+      skips = [
+        *(skip.pattern for skip in self.regex_skips),
+        *(re.escape(skip) for skip in self.string_skips),
+      ]
+      # one match consumes a whole run of adjacent skips
+      self._skip_re = re.compile("(?:" + "|".join(skips) + ")+")
+    self._skip_impl = self._skip_regex
 
   def _increment_location(self,
                           line: int,
                           column: int,
-                          whole: str
+                          code: str,
+                          start: int,
+                          end: int
                           ) -> tuple[int, int]:
-    for char in whole:
-      if char == "\n":
-        line += 1
-        column = 1
-      else:
-        column += 1
+    newlines = code.count("\n", start, end)
+    if newlines:
+      line += newlines
+      column = end - code.rfind("\n", start, end)
+    else:
+      column += end - start
 
     return line, column
 
-  def _run_skips(self,
-                 line: int,
-                 column: int,
-                 code: str
-                 ) -> tuple[int, int, str]:
+  def _compile(self) -> tuple[tuple[re.Pattern[str], TokenTypes_T | None], ...]:
+    if self._compiled is not None:
+      return self._compiled
+
+    # regexes come before strings so they keep their matching priority
+    patterns: list[tuple[TokenTypes_T, str]] = [
+      *((type, regex.pattern) for type, regex in self.regexes.items()),
+      *((type, re.escape(string)) for type, string in self.strings.items()),
+    ]
+    regex_count = len(self.regexes)
+    mergeable = [self._mergeable[type] for type in self.regexes] + [True] * len(self.strings)
+    self._group_to_type = {}
+    alternatives: list[str] = []
+    starts: list[set[int] | None] = []
+    for i, (type, pattern) in enumerate(patterns):
+      name = f"T{i}"
+      self._group_to_type[name] = type
+      alternatives.append(f"(?P<{name}>{pattern})")
+      starts.append(_first_chars(pattern))
+
+    def join(candidates: tuple[int, ...]) -> tuple[tuple[re.Pattern[str], TokenTypes_T | None], ...]:
+      # runs of mergeable patterns become one alternation, the others are
+      # tried on their own in between. a pattern alone in its run has its
+      # type known up front, so it's compiled as is, without a named group
+      joined: list[tuple[re.Pattern[str], TokenTypes_T | None]] = []
+      run: list[int] = []
+      for i in [*candidates, None]:
+        if i is not None and mergeable[i]:
+          run.append(i)
+          continue
+        if len(run) == 1:
+          type, pattern = patterns[run[0]]
+          joined.append((re.compile(pattern), type))
+        elif len(run) > 1:
+          joined.append((re.compile("|".join(alternatives[j] for j in run)), None))
+        run = []
+        if i is not None:
+          type = patterns[i][0]
+          joined.append((self.regexes[type], type))
+      return tuple(joined)
+
+    # strings are matched through the trie, only when no regex matched,
+    # so the regex tables below only hold the regexes
+    self._compiled = join(tuple(range(regex_count)))
+
+    # for every possible first character, only try the regexes that can
+    # start with it, plus the ones whose first characters are unknown
+    by_candidates: dict[tuple[int, ...], tuple[tuple[re.Pattern[str], TokenTypes_T | None], ...]] = {}
+    self._start_table = []
+    for c in range(256):
+      candidates = tuple(
+        i for i, chars in enumerate(starts[:regex_count])
+        if chars is None or c in chars)
+      if candidates not in by_candidates:
+        by_candidates[candidates] = join(candidates)
+      self._start_table.append(by_candidates[candidates])
+
+    # strings by character, with None keys holding the (index, type) of the
+    # string ending there, so all strings are tried in a single walk
+    self._str_trie = {}
+    for i, (type, string) in enumerate(self.strings.items()):
+      if len(string) == 0: continue
+      node = self._str_trie
+      for char in string:
+        node = node.setdefault(char, {})
+      node.setdefault(None, (i, type))
+
+    # a one character string that is the first candidate for its character
+    # always wins, so it can be looked up without running any regex.
+    # first characters are only known below 256, so other strings are
+    # left to the regexes and the trie
+    self._single_char_strings = {}
+    for i, (type, string) in enumerate(self.strings.items(), regex_count):
+      if len(string) != 1 or ord(string) >= 256: continue
+      c = ord(string)
+      first = next(
+        j for j, chars in enumerate(starts)
+        if chars is None or c in chars)
+      if first == i:
+        self._single_char_strings[string] = type
+
+    return self._compiled
+
+  def _match_string(self, code: str, pos: int) -> tuple[TokenTypes_T, int] | None:
+    # among the strings the code continues with, the first registered wins
+    node = self._str_trie
+    best: tuple[int, TokenTypes_T, int] | None = None
+    code_len = len(code)
+    while pos < code_len:
+      node = node.get(code[pos])
+      if node is None: break
+      pos += 1
+      terminal = node.get(None)
+      if terminal is not None and (best is None or terminal[0] < best[0]):
+        best = (terminal[0], terminal[1], pos)
+    if best is None: return None
+    return best[1], best[2]
+
+  def _skip_none(self, code: str, pos: int) -> int:
+    return pos
+
+  def _skip_single_string(self, code: str, pos: int) -> int:
+    skip = self.string_skips[0]
+    while code.startswith(skip, pos):
+      pos += len(skip)
+    return pos
+
+  def _skip_separately(self, code: str, pos: int) -> int:
     while True:
-      skip_matched = False
+      start = pos
 
       for skip in self.regex_skips:
-        m = re.match(skip, code)
-        if m is None: continue
-        skip_matched = True
-        whole = m.group(0)
-        code = code[len(whole):]
-        line, column = self._increment_location(line, column, whole)
-
-      for skip in self.string_skips:
-        if not code.startswith(skip): continue
-        skip_matched = True
-        code = code[len(skip):]
-        line, column = self._increment_location(line, column, skip)
-        
-      if not skip_matched: break
-    return line, column, code
+        m = skip.match(code, pos)
+        if m is not None: pos = m.end()
+
+      for string in self.string_skips:
+        if code.startswith(string, pos): pos += len(string)
+
+      if pos == start: return pos
+
+  def _skip_regex(self, code: str, pos: int) -> int:
+    m = self._skip_re.match(code, pos)
+    if m is None: return pos
+    return m.end()
+
+  def scan(self,
+           file_path: str,
+           code: str
+           ) -> ScanningResult[TokenTypes_T]:
+
+    # the token types, start and end offsets as parallel lists,
+    # so no Token or Location has to be built while scanning
+    types: list[TokenTypes_T] = []
+    starts: list[int] = []
+    ends: list[int] = []
+    add_type = types.append
+    add_start = starts.append
+    add_end = ends.append
+    code_len = len(code)
+    pos: int = 0
+    compiled = self._compile()
+    start_table = self._start_table
+    single_char_strings = self._single_char_strings
+    group_to_type = self._group_to_type
+    run_skips = self._skip_impl
+    match_string = self._match_string
+
+    while pos < code_len:
+
+      pos = run_skips(code, pos)
+
+      if pos >= code_len: break
+
+      char = code[pos]
+      single = single_char_strings.get(char)
+      if single is not None:
+        add_type(single)
+        add_start(pos)
+        pos += 1
+        add_end(pos)
+        continue
+
+      c = ord(char)
+      m = None
+      for pattern, type in start_table[c] if c < 256 else compiled:
+        m = pattern.match(code, pos)
+        if m is not None: break
+      if m is None:
+        string = match_string(code, pos)
+        if string is not None:
+          type, end = string
+          add_type(type)
+          add_start(pos)
+          pos = end
+          add_end(pos)
+          continue
+        line, column = self._increment_location(1, 1, code, 0, pos)
+        loc = Location(file_path, line, column)
+        return LexingError(loc, f"SYNTAX ERROR: Invalid character: '{code[pos]}'")
+
+      add_type(type if type is not None else group_to_type[m.lastgroup])
+      add_start(pos)
+      pos = m.end()
+      add_end(pos)
+
+    return types, starts, ends
 
   def lex(self,
           file_path: str,
           code: str
           ) -> LexingResult[TokenTypes_T]:
 
+    scanned = self.scan(file_path, code)
+    if isinstance(scanned, LexingError): return scanned
+    types, starts, ends = scanned
+
     tokens: list[Token[TokenTypes_T]] = []
+    append = tokens.append
+    Tok = Token
+    Loc = Location
+    increment_location = self._increment_location
     line: int = 1
     column: int = 1
+    last: int = 0
 
-    while len(code) > 0:
-
-      line, column, code = self._run_skips(
-        line,
-        column,
-        code)
-
-      if len(code) <= 0: break
-      
-      matched = False
-
-      for type, regex in self.regexes.items():
-        m = re.match(regex, code)
-        if m is None: continue
-        matched = True
-        loc = Location(file_path, line, column)
-        whole = m.group(0)
-        code = code[len(whole):]
-
-        line, column = self._increment_location(
-          line,
-          column,
-          whole)
-        tokens.append(Token(type, whole, loc))
-        break
+    for type, start, end in zip(types, starts, ends):
+      line, column = increment_location(line, column, code, last, start)
+      append(Tok(type, code[start:end], Loc(file_path, line, column)))
+      last = start
 
-      for type, string in self.strings.items():
-        if not code.startswith(string): continue
-        matched = True
-        loc = Location(file_path, line, column)
-        code = code[len(string):]
-        line, column = self._increment_location(line, column, string)
-        tokens.append(Token(type, string, loc))
-        break
-
-      if not matched:
-        loc = Location(file_path, line, column)
-        return LexingError(loc, f"SYNTAX ERROR: Invalid character: '{code[0]}'")
-          
     return tokens
 
 ParserType_T = TypeVar("ParserType_T", covariant=True)
@@ -154,118 +465,271 @@ ParserType_V = TypeVar("ParserType_V", covariant=True)
 
 ParserType_Invariant = TypeVar("ParserType_Invariant")
 
-@dataclass
-class ParsingSuccess(Generic[TokenTypes_T, ParserType_T]):
-  value: ParserType_T
-  rest: list[Token[TokenTypes_T]]
-
-@dataclass
-class ParsingFailure(Generic[TokenTypes_T]):
-  expected: list[TokenTypes_T]
-  got: Token[TokenTypes_T]
+# (value, pos) on success, None on failure,
+# in which case the parser's last_error says why
+ParsingResult: TypeAlias = tuple[ParserType_T, int] | None
 
-ParsingResult: TypeAlias = ParsingSuccess[TokenTypes_T, ParserType_T] | ParsingFailure[TokenTypes_T]
+ParsingError: TypeAlias = tuple[list[TokenTypes_T], Token[TokenTypes_T]]
 
 @dataclass
 class Seq(Generic[ParserType_T, ParserType_U]):
   left: ParserType_T
   right: ParserType_U
 
+# parser operations, see `run` for how each one is interpreted
+OP_TOKEN = 0 # args: (type, mapper)
+OP_SEQ = 1 # args: (left, right)
+OP_SEQ_LEFT = 2 # args: (left, right)
+OP_SEQ_RIGHT = 3 # args: (left, right)
+OP_ALT = 4 # args: (left, right)
+OP_MAP = 5 # args: (parser, mapper)
+OP_LAZY = 6 # args: (parser_fn,)
+OP_MEMO = 7 # args: (parser,)
+
+_parser_ids = count()
+
+@dataclass(eq=False)
 class Parser(Generic[TokenTypes_T, ParserType_T]):
-  def __init__(self, parse: Callable[[list[Token[TokenTypes_T]]], ParsingResult[TokenTypes_T, ParserType_T]]) -> None:
-    self.parse = parse
+  op: int
+  args: tuple[Any, ...]
+  parser_id: int = field(default_factory=lambda: next(_parser_ids), init=False)
+  last_error: ParsingError[TokenTypes_T] | None = field(default=None, init=False)
+  _compiled: Any = field(default=None, init=False, repr=False)
+
+  def parse(self, tokens: list[Token[TokenTypes_T]], pos: int = 0) -> ParsingResult[ParserType_T]:
+    return run(self, tokens, pos)
+
+  def compile(self) -> Callable[[list[Token[TokenTypes_T]], int], ParsingResult[ParserType_T]]:
+    # lazy parsers are resolved once here, so the whole grammar
+    # has to be defined before this gets called
+    if self._compiled is None:
+      self._compiled = _compile_parser(self)
+    return self._compiled
 
   def sequence_right(self, parser: 'Parser[TokenTypes_T, ParserType_U]') -> 'Parser[TokenTypes_T, ParserType_U]':
-    def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, ParserType_U]:
-      result1 = self.parse(tokens)
-      match result1:
-        case ParsingFailure(exp, got):
-          return ParsingFailure(exp, got)
-        case ParsingSuccess(_, rest):
-          result2 = parser.parse(rest)
-          return result2
-    return Parser(parse)
+    return Parser(OP_SEQ_RIGHT, (self, parser))
   __rshift__ = sequence_right
   def sequence_left(self, parser: 'Parser[TokenTypes_T, ParserType_U]') -> 'Parser[TokenTypes_T, ParserType_T]':
-    def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, ParserType_T]:
-      result1 = self.parse(tokens)
-      match result1:
-        case ParsingFailure(exp, got):
-          return ParsingFailure(exp, got)
-        case ParsingSuccess(x, rest):
-          result2 = parser.parse(rest)
-          match result2:
-            case ParsingFailure(exp, got):
-              return ParsingFailure(exp, got)
-            case ParsingSuccess(_, rest):
-              return ParsingSuccess(x, rest)
-    return Parser(parse)
+    return Parser(OP_SEQ_LEFT, (self, parser))
   __lshift__ = sequence_left
   def sequence(self, parser: 'Parser[TokenTypes_T, ParserType_U]') -> 'SeqParser[TokenTypes_T, ParserType_T, ParserType_U]':
-    def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, Seq[ParserType_T, ParserType_U]]:
-      match self.parse(tokens):
-        case ParsingFailure(exp, got):
-          return ParsingFailure(exp, got)
-        case ParsingSuccess(x, rest):
-          match parser.parse(rest):
-            case ParsingFailure(exp, got):
-              return ParsingFailure(exp, got)
-            case ParsingSuccess(y, rest):
-              return ParsingSuccess(Seq(x, y), rest)
-    return SeqParser(parse)
+    return SeqParser(OP_SEQ, (self, parser))
   __xor__ = sequence
   def alt(self, parser: 'Parser[TokenTypes_T, ParserType_T]') -> 'Parser[TokenTypes_T, ParserType_T]':
-    def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, ParserType_T]:
-      match self.parse(tokens):
-        case ParsingFailure(exp1, _):
-          match parser.parse(tokens):
-            case ParsingFailure(exp2, got):
-              return ParsingFailure(exp1 + exp2, got)
-            case ParsingSuccess(x, rest):
-              return ParsingSuccess(x, rest)
-        case ParsingSuccess(x, rest):
-          return ParsingSuccess(x, rest)
-    return Parser(parse)
+    return Parser(OP_ALT, (self, parser))
   __or__ = alt
+  def memoize(self) -> 'Parser[TokenTypes_T, ParserType_T]':
+    # worth it for parsers that get backtracked over, such as a common
+    # prefix of several alternatives, otherwise it's only overhead
+    return Parser(OP_MEMO, (self,))
 
 class SeqParser(Generic[TokenTypes_T, ParserType_T, ParserType_U], Parser[TokenTypes_T, Seq[ParserType_T, ParserType_U]]):
-  def map(self, mapper: Callable[[ParserType_T, ParserType_U], ParserType_V]):
-    def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, ParserType_V]:
-      match self.parse(tokens):
-        case ParsingFailure(exp, got):
-          return ParsingFailure(exp, got)
-        case ParsingSuccess(Seq(a, b), rest):
-          return ParsingSuccess(mapper(a, b), rest)
-    return Parser(parse)
+  def map(self, mapper: Callable[[ParserType_T, ParserType_U], ParserType_V]) -> Parser[TokenTypes_T, ParserType_V]:
+    return Parser(OP_MAP, (self, mapper))
+
+# a single expected token type, or a (left, right) pair of them,
+# flattened into a list only once a whole parse has failed
+_Expected: TypeAlias = Any
+
+def _flatten_expected(expected: _Expected) -> list[TokenTypes_T]:
+  flat: list[TokenTypes_T] = []
+  stack = [expected]
+  while stack:
+    node = stack.pop()
+    if isinstance(node, tuple):
+      stack.append(node[1])
+      stack.append(node[0])
+    else:
+      flat.append(node)
+  return flat
+
+def run(parser: Parser[TokenTypes_T, ParserType_T], tokens: list[Token[TokenTypes_T]], pos: int = 0) -> ParsingResult[ParserType_T]:
+  root = parser
+  # frames waiting on the result of one of their children,
+  # as (parser, state, saved) where the state says which child it was
+  stack: list[tuple[Parser[TokenTypes_T, Any], int, Any]] = []
+  result: ParsingResult[Any]
+  # why the last failing parser failed, only meaningful when result is None.
+  # alternatives join their expected types in O(1), see `_Expected`
+  expected: _Expected = None
+  got: Token[TokenTypes_T] = EOF()
+  # results of memoized parsers by (parser_id, pos)
+  memo: dict[tuple[int, int], tuple[ParsingResult[Any], _Expected, Token[TokenTypes_T]]] = {}
+
+  while True:
+    # descend into the leftmost child until a token parser gives a result
+    while True:
+      op = parser.op
+      if op == OP_TOKEN:
+        type, mapper = parser.args
+        if pos >= len(tokens):
+          result = None
+          expected, got = type, EOF()
+        elif tokens[pos].type == type:
+          result = (mapper(tokens[pos].value), pos + 1)
+        else:
+          result = None
+          expected, got = type, tokens[pos]
+        break
+      if op == OP_LAZY:
+        parser = parser.args[0]()
+        continue
+      if op == OP_MEMO:
+        key = (parser.parser_id, pos)
+        if key in memo:
+          result, expected, got = memo[key]
+          break
+        stack.append((parser, 0, key))
+        parser = parser.args[0]
+        continue
+      stack.append((parser, 0, pos))
+      parser = parser.args[0]
+
+    # hand the result back up until some frame needs to parse its next child
+    while stack:
+      frame, state, saved = stack.pop()
+      op = frame.op
+      if op == OP_MEMO:
+        memo[saved] = (result, expected, got)
+        continue
+      if op == OP_ALT:
+        if state == 1:
+          if result is None:
+            expected = (saved, expected)
+          continue
+        if result is not None: continue
+        stack.append((frame, 1, expected))
+        parser, pos = frame.args[1], saved
+        break
+      if result is None: continue
+      value, pos = result
+      if op == OP_MAP:
+        result = (frame.args[1](value.left, value.right), pos)
+        continue
+      if state == 0:
+        stack.append((frame, 1, value))
+        parser = frame.args[1]
+        break
+      if op == OP_SEQ:
+        result = (Seq(saved, value), pos)
+      elif op == OP_SEQ_LEFT:
+        result = (saved, pos)
+    else:
+      root.last_error = None if result is not None else (_flatten_expected(expected), got)
+      return result
+
+def _compile_parser(root: Parser[TokenTypes_T, ParserType_T]) -> Callable[[list[Token[TokenTypes_T]], int], ParsingResult[ParserType_T]]:
+  # every parser in the grammar becomes one nested function of a generated
+  # `parse`, which shares the token list, the memo tables and the error
+  # information (as [expected, got], like in `run`) between them
+  namespace: dict[str, Any] = {"Seq": Seq, "EOF": EOF}
+  names: dict[int, str] = {}
+  pending: list[Parser[TokenTypes_T, Any]] = []
+  memo_names: list[str] = []
+  defs: list[str] = []
+
+  def name_of(parser: Parser[TokenTypes_T, Any]) -> str:
+    while parser.op == OP_LAZY:
+      parser = parser.args[0]()
+    if id(parser) not in names:
+      names[id(parser)] = f"p{len(names)}"
+      pending.append(parser)
+    return names[id(parser)]
+
+  root_name = name_of(root)
+  while pending:
+    parser = pending.pop()
+    f = names[id(parser)]
+    op = parser.op
+    defs.append(f"  def {f}(pos):")
+    if op == OP_TOKEN:
+      namespace[f"{f}_type"], namespace[f"{f}_mapper"] = parser.args
+      defs += [
+        f"    if pos >= tokens_len:",
+        f"      err[0] = {f}_type",
+        f"      err[1] = EOF()",
+        f"      return None",
+        f"    token = tokens[pos]",
+        f"    if token.type == {f}_type:",
+        f"      return ({f}_mapper(token.value), pos + 1)",
+        f"    err[0] = {f}_type",
+        f"    err[1] = token",
+        f"    return None",
+      ]
+    elif op == OP_ALT:
+      left, right = name_of(parser.args[0]), name_of(parser.args[1])
+      defs += [
+        f"    r = {left}(pos)",
+        f"    if r is not None: return r",
+        f"    expected = err[0]",
+        f"    r = {right}(pos)",
+        f"    if r is None: err[0] = (expected, err[0])",
+        f"    return r",
+      ]
+    elif op == OP_MAP:
+      namespace[f"{f}_mapper"] = parser.args[1]
+      defs += [
+        f"    r = {name_of(parser.args[0])}(pos)",
+        f"    if r is None: return None",
+        f"    seq, pos = r",
+        f"    return ({f}_mapper(seq.left, seq.right), pos)",
+      ]
+    elif op == OP_MEMO:
+      memo_names.append(f"{f}_memo")
+      defs += [
+        f"    if pos in {f}_memo:",
+        f"      r, err[0], err[1] = {f}_memo[pos]",
+        f"      return r",
+        f"    r = {name_of(parser.args[0])}(pos)",
+        f"    {f}_memo[pos] = (r, err[0], err[1])",
+        f"    return r",
+      ]
+    else:
+      left, right = name_of(parser.args[0]), name_of(parser.args[1])
+      defs += [
+        f"    r = {left}(pos)",
+        f"    if r is None: return None",
+        f"    value, pos = r",
+      ]
+      if op == OP_SEQ_RIGHT:
+        defs.append(f"    return {right}(pos)")
+      else:
+        defs += [
+          f"    r = {right}(pos)",
+          f"    if r is None: return None",
+          f"    return (Seq(value, r[0]), r[1])" if op == OP_SEQ else
+          f"    return (value, r[1])",
+        ]
+
+  source = "\n".join([
+    "def parse(tokens, pos):",
+    "  tokens_len = len(tokens)",
+    "  err = [None, None]",
+    *(f"  {memo_name} = {{}}" for memo_name in memo_names),
+    *defs,
+    f"  return {root_name}(pos), err",
+  ])
+  exec(compile(source, "<grammar>", "exec"), namespace)
+  generated = namespace["parse"]
+
+  def parse(tokens: list[Token[TokenTypes_T]], pos: int = 0) -> ParsingResult[ParserType_T]:
+    try:
+      result, (expected, got) = generated(tokens, pos)
+    except RecursionError:
+      # nested deeper than the generated functions can call each other
+      return run(root, tokens, pos)
+    root.last_error = None if result is not None else (_flatten_expected(expected), got)
+    return result
+  return parse
 
 def token(type: TokenTypes_T, mapper: Callable[[str], ParserType_T]) -> Parser[TokenTypes_T, ParserType_T]:
-  def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, ParserType_T]:
-    if len(tokens) == 0:
-      return ParsingFailure([type], EOF())
-    if tokens[0].type == type:
-      return ParsingSuccess(mapper(tokens[0].value), tokens[1:])
-    return ParsingFailure([type], tokens[1])
-  return Parser(parse)
+  return Parser(OP_TOKEN, (type, mapper))
 
 def singleton(type: TokenTypes_T, value: ParserType_Invariant) -> Parser[TokenTypes_T, ParserType_Invariant]:
-  def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, ParserType_Invariant]:
-    if len(tokens) == 0:
-      return ParsingFailure([type], EOF())
-    if tokens[0].type == type:
-      return ParsingSuccess(value, tokens[1:])
-    return ParsingFailure([type], tokens[0])
-  return Parser(parse)
+  return Parser(OP_TOKEN, (type, lambda _: value))
 
 def lazy(parser_fn: Callable[[], Parser[TokenTypes_T, ParserType_T]]) -> Parser[TokenTypes_T, ParserType_T]:
-  def parse(tokens: list[Token[TokenTypes_T]]):
-    return parser_fn().parse(tokens)
-  return Parser(parse)
+  return Parser(OP_LAZY, (parser_fn,))
 
 def ignore(type: TokenTypes_T) -> Parser[TokenTypes_T, None]:
-  def parse(tokens: list[Token[TokenTypes_T]]) -> ParsingResult[TokenTypes_T, None]:
-    if len(tokens) == 0:
-      return ParsingFailure([type], EOF())
-    if tokens[0].type == type:
-      return ParsingSuccess(None, tokens[1:])
-    return ParsingFailure([type], tokens[0])
-  return Parser(parse)
+  return Parser(OP_TOKEN, (type, lambda _: None))
@@ -1,5 +1,6 @@
 
-from typing import Union
+from array import array
+from typing import Callable, ClassVar, Union
 from compy import *
 
 class TokenType(Enum):
@@ -20,17 +21,26 @@ lexer.skip_regex(r"\s+")
 ExprNode: TypeAlias = Union[
   'IntNode', 'PlusNode', 'TimesNode']
 
+ExprNode_T = TypeVar("ExprNode_T")
+
+INT_OP = 0
+PLUS_OP = 1
+TIMES_OP = 2
+
 @dataclass
 class IntNode:
+  OP: ClassVar[int] = INT_OP
   value: str
 
 @dataclass
 class TimesNode:
+  OP: ClassVar[int] = TIMES_OP
   left: ExprNode
   right: ExprNode
 
 @dataclass
 class PlusNode:
+  OP: ClassVar[int] = PLUS_OP
   left: ExprNode
   right: ExprNode
 
@@ -41,39 +51,134 @@ def times_node(l: ExprNode, r: ExprNode) -> ExprNode:
   return TimesNode(l, r)
 
 
-expr_parser: Parser[TokenType, ExprNode] = lazy(
-  lambda: plus_parser | term_parser
-)
-
-int_parser = token(TokenType.Int, int_node)
-
-atom_parser = int_parser | (
-  ignore(TokenType.LeftParen)
-    >> expr_parser
-    << ignore(TokenType.RightParen)
-)
-
-times_parser = lazy(lambda: (
-  (atom_parser << ignore(TokenType.Times))
-    ^ atom_parser
-).map(times_node))
-
-term_parser = (
-  times_parser | atom_parser
-)
-
-plus_parser = lazy(lambda: (
-  (term_parser << ignore(TokenType.Plus))
-    ^ term_parser
-).map(plus_node))
+def expr_grammar(
+    int_node: Callable[[str], ExprNode_T],
+    plus_node: Callable[[ExprNode_T, ExprNode_T], ExprNode_T],
+    times_node: Callable[[ExprNode_T, ExprNode_T], ExprNode_T]
+    ) -> Parser[TokenType, ExprNode_T]:
+
+  expr_parser: Parser[TokenType, ExprNode_T] = lazy(
+    lambda: plus_parser | term_parser
+  )
+
+  int_parser = token(TokenType.Int, int_node)
+
+  atom_parser = (int_parser | (
+    ignore(TokenType.LeftParen)
+      >> expr_parser
+      << ignore(TokenType.RightParen)
+  )).memoize()
+
+  times_parser = lazy(lambda: (
+    (atom_parser << ignore(TokenType.Times))
+      ^ atom_parser
+  ).map(times_node))
+
+  term_parser = (
+    times_parser | atom_parser
+  ).memoize()
+
+  plus_parser = lazy(lambda: (
+    (term_parser << ignore(TokenType.Plus))
+      ^ term_parser
+  ).map(plus_node))
+
+  return expr_parser
+
+expr_parser = expr_grammar(int_node, plus_node, times_node)
+
+class AstArena:
+  # the nodes of parsed expressions as parallel arrays, indexed by node id.
+  # children are always added before their parents, so every node's
+  # operands have smaller ids than the node itself
+  def __init__(self):
+    self.op: array[int] = array("B")
+    self.left: array[int] = array("i")
+    self.right: array[int] = array("i")
+    self.value: list[str] = []
+
+  def clear(self) -> None:
+    del self.op[:], self.left[:], self.right[:], self.value[:]
+
+  def _add(self, op: int, left: int, right: int, value: str) -> int:
+    self.op.append(op)
+    self.left.append(left)
+    self.right.append(right)
+    self.value.append(value)
+    return len(self.value) - 1
+
+  def int_node(self, n: str) -> int:
+    return self._add(INT_OP, -1, -1, n)
+  def plus_node(self, l: int, r: int) -> int:
+    return self._add(PLUS_OP, l, r, "")
+  def times_node(self, l: int, r: int) -> int:
+    return self._add(TIMES_OP, l, r, "")
+
+  def eval(self, root: int) -> int:
+    # one pass in id order, no stack needed since operands come first.
+    # nodes left over from backtracking get evaluated too, but are cheap
+    op, left, right, value = self.op, self.left, self.right, self.value
+    values: list[int] = [0] * (root + 1)
+    for i in range(root + 1):
+      node_op = op[i]
+      if node_op == INT_OP:
+        values[i] = int(value[i])
+      elif node_op == PLUS_OP:
+        values[i] = values[left[i]] + values[right[i]]
+      else:
+        values[i] = values[left[i]] * values[right[i]]
+    return values[root]
+
+arena = AstArena()
+arena_expr_parser = expr_grammar(
+  arena.int_node, arena.plus_node, arena.times_node)
 
 def eval_expr(node: ExprNode) -> int:
-  match node:
-    case IntNode(n): return int(n)
-    case TimesNode(l, r):
-      return eval_expr(l) * eval_expr(r)
-    case PlusNode(l, r):
-      return eval_expr(l) + eval_expr(r)
+  # post-order walk, binary nodes are visited once to queue up
+  # their operands and once more to combine their values
+  stack: list[tuple[ExprNode, bool]] = [(node, False)]
+  values: list[int] = []
+  while stack:
+    node, operands_done = stack.pop()
+    op = node.OP
+    if op == INT_OP:
+      values.append(int(node.value))
+      continue
+    if not operands_done:
+      stack.append((node, True))
+      stack.append((node.right, False))
+      stack.append((node.left, False))
+      continue
+    r = values.pop()
+    l = values.pop()
+    values.append(l + r if op == PLUS_OP else l * r)
+  return values[0]
+
+def compile_expr(node: ExprNode) -> Callable[[], int]:
+  # same walk as eval_expr, but building python source
+  # that gets compiled once and can then be called repeatedly
+  root = node
+  stack: list[tuple[ExprNode, bool]] = [(node, False)]
+  sources: list[str] = []
+  while stack:
+    node, operands_done = stack.pop()
+    op = node.OP
+    if op == INT_OP:
+      sources.append(str(int(node.value)))
+      continue
+    if not operands_done:
+      stack.append((node, True))
+      stack.append((node.right, False))
+      stack.append((node.left, False))
+      continue
+    r = sources.pop()
+    l = sources.pop()
+    sources.append(f"({l} {'+' if op == PLUS_OP else '*'} {r})")
+  try:
+    return eval(compile(f"lambda: {sources[0]}", "<expr>", "eval"))
+  except (SyntaxError, RecursionError, MemoryError):
+    # too deeply nested for python's own compiler
+    return lambda: eval_expr(root)
 
 code = "1 * (2 + 3)"
 lexing_result = lexer.lex("<stdin>", code)
@@ -83,10 +188,17 @@ match lexing_result:
     exit(1)
   case _: pass
 match expr_parser.parse(lexing_result):
-  case ParsingSuccess(value, rest):
+  case (value, _):
     print(f"SUCCESS: {value}")
     print(f"RESULT: {eval_expr(value)}")
-  case ParsingFailure(exp, got):
+    print(f"COMPILED: {compile_expr(value)()}")
+    arena.clear()
+    match arena_expr_parser.parse(lexing_result):
+      case (root, _):
+        print(f"ARENA: {arena.eval(root)}")
+      case None: pass
+  case None:
+    exp, got = expr_parser.last_error
     print(f"FAILURE: Expected {exp}, got {got}")
 
 
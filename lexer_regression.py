@@ -0,0 +1,120 @@
+
+# compares Lexer.lex against a lexer that just tries every regex and then
+# every string in registration order, over pattern shapes that the lexer's
+# first-character tables and merged alternations have gotten wrong before
+
+import random
+from compy import *
+
+class TokenType(Enum):
+  A = auto()
+  B = auto()
+  C = auto()
+  D = auto()
+  E = auto()
+  F = auto()
+  G = auto()
+  H = auto()
+
+def location(code: str, pos: int) -> str:
+  line = code.count("\n", 0, pos) + 1
+  column = pos - code.rfind("\n", 0, pos)
+  return f"{line}:{column}"
+
+def reference_lex(lexer: Lexer[TokenType], code: str) -> list[tuple[str, str, str]] | str:
+  tokens: list[tuple[str, str, str]] = []
+  pos = 0
+  while pos < len(code):
+    start = -1
+    while start != pos:
+      start = pos
+      for skip in lexer.regex_skips:
+        m = skip.match(code, pos)
+        if m is not None: pos = m.end()
+      for string in lexer.string_skips:
+        if code.startswith(string, pos): pos += len(string)
+    if pos >= len(code): break
+
+    for type, regex in lexer.regexes.items():
+      m = regex.match(code, pos)
+      if m is None: continue
+      tokens.append((type.name, m.group(0), location(code, pos)))
+      pos = m.end()
+      break
+    else:
+      for type, string in lexer.strings.items():
+        if not code.startswith(string, pos): continue
+        tokens.append((type.name, string, location(code, pos)))
+        pos += len(string)
+        break
+      else:
+        return f"error at {location(code, pos)}"
+  return tokens
+
+def lex(lexer: Lexer[TokenType], code: str) -> list[tuple[str, str, str]] | str:
+  result = lexer.lex("<test>", code)
+  if isinstance(result, LexingError):
+    return f"error at {result.location.line}:{result.location.column}"
+  return [
+    (token.type.name, token.value, f"{token.location.line}:{token.location.column}")
+    for token in result]
+
+# (regexes, strings, regex skips, string skips)
+GRAMMARS: list[tuple[list[str], list[str], list[str], list[str]]] = [
+  # a string above U+00FF competing with a regex
+  ([r"\w+"], ["λ", "+"], [r"\s+"], []),
+  # ASCII-only classes, negated ones match non-ASCII characters
+  ([r"(?a:\W)+", r"\w+"], [], [r"\s+"], []),
+  ([r"(?a)\W+", r"\w+"], [], [r"\s+"], []),
+  ([r"(?a:\w)+", r"\S"], [], [r"\s+"], []),
+  # case-insensitive patterns
+  ([r"(?i)if", r"(?i:λ)x", r"\w+"], ["Λ"], [r"\s+"], []),
+  # group names and numbered references
+  ([r"(?P<d>\d)x", r"(?P<d>\d)y", r"(\w)\1", r"\w"], [], [r"\s+"], []),
+  ([r"(x)y", r"(a)(?>\1)b", r"\w"], [], [r"\s+"], []),
+  # ranges and classes crossing 255
+  ([r"[\u00f0-\u0400]+", r"[^a-z\s]", r"[a-z]+"], [], [r"\s+"], []),
+  # nullable prefixes, lazy repeats, anchors and branches
+  ([r"x?λ", r"a|b*c", r"\bab", r"\d+?", r"."], ["ab", "a"], [], []),
+  # overlapping strings in registration order
+  ([r"\d+"], ["-", "->", "=", "=="], [r"\s+", r"#[^\n]*"], [";"]),
+  # skips that can match nothing, or can't be joined with the other skips
+  ([r"\w"], [], [r"(?:x|y)*", r"\s+"], []),
+  ([r"\w"], [], [r"(?a)\s"], [";"]),
+  ([r"\w"], [], [r"(?x) \s "], []),
+]
+
+ALPHABET = list("abcxyz019 \n#;-=>+λΛéü\u00ffĀ_") + ["if", "IF", "λx", "Λx"]
+
+def main() -> None:
+  random.seed(0)
+  failures = 0
+  for regexes, strings, regex_skips, string_skips in GRAMMARS:
+    types = list(TokenType)
+    lexer = Lexer[TokenType]()
+    for i, regex in enumerate(regexes):
+      lexer.add_regex(types[i], regex)
+    for i, string in enumerate(strings, len(regexes)):
+      lexer.add_str(types[i], string)
+    for regex in regex_skips:
+      lexer.skip_regex(regex)
+    for string in string_skips:
+      lexer.skip_string(string)
+
+    for _ in range(2000):
+      code = "".join(random.choice(ALPHABET) for _ in range(random.randint(0, 10)))
+      expected = reference_lex(lexer, code)
+      got = lex(lexer, code)
+      if got != expected:
+        failures += 1
+        print(f"MISMATCH {regexes} {strings}: {code!r}")
+        print(f"  expected {expected}")
+        print(f"  got      {got}")
+        break
+
+  if failures:
+    exit(1)
+  print("OK")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,116 @@
+
+# compares Parser.compile() against Parser.parse, on the results and on
+# last_error, over grammars shaped like the one in demo.py, with and without
+# memoization, and on inputs nested deep enough for compile() to fall back
+
+import random
+from compy import *
+
+class TokenType(Enum):
+  Int = auto()
+  Plus = auto()
+  Times = auto()
+  LeftParen = auto()
+  RightParen = auto()
+
+lexer = Lexer[TokenType]()
+lexer.add_regex(TokenType.Int, r"\d+")
+lexer.add_str(TokenType.Plus, "+")
+lexer.add_str(TokenType.Times, "*")
+lexer.add_str(TokenType.LeftParen, "(")
+lexer.add_str(TokenType.RightParen, ")")
+lexer.skip_regex(r"\s+")
+
+def expr_grammar(memoize: bool) -> Parser[TokenType, Any]:
+  def memo(parser: Parser[TokenType, Any]) -> Parser[TokenType, Any]:
+    return parser.memoize() if memoize else parser
+
+  expr_parser: Parser[TokenType, Any] = lazy(
+    lambda: plus_parser | term_parser
+  )
+
+  atom_parser = memo(token(TokenType.Int, int) | (
+    ignore(TokenType.LeftParen)
+      >> expr_parser
+      << ignore(TokenType.RightParen)
+  ))
+
+  times_parser = lazy(lambda: (
+    (atom_parser << ignore(TokenType.Times))
+      ^ atom_parser
+  ).map(lambda l, r: ("*", l, r)))
+
+  term_parser = memo(times_parser | atom_parser)
+
+  plus_parser = lazy(lambda: (
+    (term_parser << ignore(TokenType.Plus))
+      ^ term_parser
+  ).map(lambda l, r: ("+", l, r)))
+
+  return expr_parser
+
+def list_grammar() -> Parser[TokenType, Any]:
+  # right recursive, with every kind of sequence and a root that isn't lazy
+  items_parser: Parser[TokenType, Any] = lazy(
+    lambda: (item_parser ^ items_parser).map(lambda l, r: (l, *r)) | singleton(TokenType.RightParen, ())
+  )
+  item_parser = token(TokenType.Int, int) | singleton(TokenType.Plus, "+") | singleton(TokenType.Times, "*")
+  return ignore(TokenType.LeftParen) >> items_parser
+
+def outcome(parser: Parser[TokenType, Any], result: ParsingResult[Any]) -> Any:
+  if result is not None: return result
+  assert parser.last_error is not None
+  expected, got = parser.last_error
+  if isinstance(got, EOF):
+    return [type.name for type in expected], "EOF"
+  return [type.name for type in expected], (got.type.name, got.value, repr(got.location))
+
+ALPHABET = ["1", "23", "+", "*", "(", ")", " "]
+
+def main() -> None:
+  random.seed(0)
+  failures = 0
+  # (name, parser, whether to also parse the deeply nested inputs,
+  # which the unmemoized grammar would backtrack over exponentially)
+  grammars = [
+    ("expr, memoized", expr_grammar(True), True),
+    ("expr", expr_grammar(False), False),
+    ("list", list_grammar(), True),
+  ]
+  # (code, whether to start parsing from a random token instead of the first),
+  # short enough that the expected types of a failure, which multiply with
+  # every unclosed parenthesis, stay few
+  codes = [
+    ("".join(random.choice(ALPHABET) for _ in range(random.randint(0, 8))), True)
+    for _ in range(2000)
+  ]
+  # deeper than the generated functions can recurse, so compile() has to
+  # fall back to parse, both for successful and for failing parses
+  deep_codes = [
+    ("(" * 3000 + "1" + ")" * 3000, False),
+    ("(" * 3000 + "1" + ")" * 2999, False),
+    ("(" + "1 " * 3000 + ")", False),
+    ("(" + "1 " * 3000, False),
+  ]
+
+  for name, parser, deep in grammars:
+    compiled = parser.compile()
+    for code, random_start in codes + deep_codes if deep else codes:
+      tokens = lexer.lex("<test>", code)
+      assert not isinstance(tokens, LexingError)
+      pos = random.randint(0, len(tokens)) if random_start else 0
+      expected = outcome(parser, parser.parse(tokens, pos))
+      got = outcome(parser, compiled(tokens, pos))
+      if got != expected:
+        failures += 1
+        print(f"MISMATCH {name}: {code[:40]!r} from token {pos}")
+        print(f"  expected {str(expected)[:200]}")
+        print(f"  got      {str(got)[:200]}")
+        break
+
+  if failures:
+    exit(1)
+  print("OK")
+
+if __name__ == "__main__":
+  main()